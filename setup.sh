@@ -0,0 +1 @@
+python3 -m pip install -r requirements.txt
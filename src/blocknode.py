@@ -155,8 +155,8 @@ def block_node_to_html_node(block_node):
     content = block_node.content
     return ParentNode("p", text_to_children(content))
 
-def markdown_to_html(content):
-    return block_node_to_html_node(BlockNode(content, BlockType.MAIN)).to_html()
+def markdown_to_html_node(content):
+    return block_node_to_html_node(BlockNode(content, BlockType.MAIN))
 
 def text_to_children(text):
     return [text_node_to_html_node(text_node) for text_node in text_to_textnodes(text)]
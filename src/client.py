@@ -0,0 +1,31 @@
+import json
+import socket
+import sys
+
+from constants import DAEMON_SOCKET
+
+def request(path_socket, command):
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as connection:
+        connection.connect(path_socket)
+        connection.sendall(f"{command}\n".encode())
+        connection.shutdown(socket.SHUT_WR)
+        response = b""
+        while chunk := connection.recv(4096):
+            response += chunk
+    return json.loads(response)
+
+def main():
+    command = sys.argv[1] if len(sys.argv) > 1 else "build"
+    try:
+        response = request(DAEMON_SOCKET, command)
+    except (FileNotFoundError, ConnectionRefusedError):
+        print("Daemon not running (start daemon.sh)", file=sys.stderr)
+        sys.exit(1)
+    if "error" in response:
+        print(response["error"], file=sys.stderr)
+        sys.exit(1)
+    for path in response.get("changed", []):
+        print(path)
+
+if __name__ == "__main__":
+    main()
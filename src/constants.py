@@ -2,8 +2,16 @@ PUBLIC_FOLDER = "./public"
 STATIC_FOLDER = "./static"
 CONTENT_FOLDER = "./content"
 TEMPLATE_FILE = "./template.html"
+DAEMON_SOCKET = "./build.sock"
+IMAGE_CACHE_FOLDER = "./.image_cache"
 
 LOG_LEVEL = 'DEBUG'
 
 MARKDOWN_EXTENSION = "md"
-HTML_EXTENSION = "html"
\ No newline at end of file
+HTML_EXTENSION = "html"
+IMAGE_EXTENSIONS = ["png", "jpg", "jpeg", "gif", "webp"]
+
+# Widths of the downscaled image derivatives in pixels
+IMAGE_WIDTHS = [480, 960, 1920]
+# Rendered width of images in the article column of index.css
+IMAGE_SIZES = "(max-width: 840px) calc(100vw - 40px), 800px"
\ No newline at end of file
@@ -0,0 +1,236 @@
+import filecmp
+import json
+import logging
+import os
+import socket
+import socketserver
+import sys
+import time
+
+import logger_config
+import fileutils
+
+from constants import LOG_LEVEL, STATIC_FOLDER, CONTENT_FOLDER, PUBLIC_FOLDER, TEMPLATE_FILE, DAEMON_SOCKET
+from constants import MARKDOWN_EXTENSION, HTML_EXTENSION, IMAGE_CACHE_FOLDER
+from imageutils import ImagePipeline, image_transform
+
+logger = logging.getLogger(__name__)
+
+class Builder:
+    # Keeps directory listings, the template, image sizes and the parsed pages in memory between builds.
+    # Everything is keyed by the modification time of its source, so a build only touches changed files.
+    def __init__(self, path_static, path_content, path_public, path_template, path_image_cache):
+        self.path_static = path_static
+        self.path_content = path_content
+        self.path_public = path_public
+        self.path_template = path_template
+        self.listings = {}
+        self.template = None
+        self.pages = {}
+        self.copies = {}
+        self.image_pipeline = ImagePipeline(path_image_cache)
+        self.images = None
+        self.outputs = None
+        self.directories = set()
+        self.visited = set()
+
+    def build(self):
+        # The first build starts from a clean public folder just like main.py
+        if self.outputs is None:
+            fileutils.delete_directory_recursively(self.path_public)
+            self.outputs = set()
+
+        changed = []
+        outputs = set()
+        self.visited = set()
+        template_changed = self.load_template()
+
+        static_files = list(self.walk(self.path_static, self.path_public))
+        for path_source, path_dest in static_files:
+            outputs.add(path_dest)
+            if self.copy_if_changed(path_source, path_dest):
+                changed.append(path_dest)
+
+        images, derivatives, copied = self.image_pipeline.process(static_files, self.path_public)
+        outputs.update(derivatives)
+        changed.extend(copied)
+        # Pages have to be parsed again if any image attributes changed
+        images_changed = images != self.images
+        self.images = images
+
+        sources = {path_source for path_source, _ in static_files}
+        for path_source, path_dest in self.walk(self.path_content, self.path_public):
+            sources.add(path_source)
+            if not fileutils.has_extension(path_source, MARKDOWN_EXTENSION):
+                logger.debug(f"Skipping file {path_source} with unknown extension")
+                continue
+            path_dest_html = fileutils.change_extension(path_dest, HTML_EXTENSION)
+            outputs.add(path_dest_html)
+            if self.render_if_changed(path_source, path_dest_html, template_changed, images_changed):
+                changed.append(path_dest_html)
+
+        # Outputs of deleted sources are removed as well
+        for path_dest in self.outputs - outputs:
+            logger.debug(f"Removing stale file {path_dest}")
+            if os.path.exists(path_dest):
+                os.remove(path_dest)
+            changed.append(path_dest)
+        self.outputs = outputs
+        self.remove_stale_directories()
+        self.prune_caches(sources)
+
+        logger.info(f"Build finished with {len(changed)} changed files")
+        return sorted(changed)
+
+    def remove_stale_directories(self):
+        # Deepest directories first, so parents are empty by the time they are checked
+        directories = {path_dest for _, path_dest in self.visited}
+        for path_dest in sorted(self.directories - directories, key=len, reverse=True):
+            if os.path.isdir(path_dest) and not os.listdir(path_dest):
+                logger.debug(f"Removing empty directory {path_dest}")
+                os.rmdir(path_dest)
+        self.directories = directories
+
+        sources = {path_source for path_source, _ in self.visited}
+        self.listings = {path: listing for path, listing in self.listings.items() if path in sources}
+
+    def prune_caches(self, sources):
+        # Deleted sources must not stay in memory for the lifetime of the daemon
+        self.copies = {path: copy for path, copy in self.copies.items() if path in sources}
+        self.pages = {path: page for path, page in self.pages.items() if path in sources}
+        self.image_pipeline.sources = {path: info for path, info in self.image_pipeline.sources.items() if path in sources}
+
+    def load_template(self):
+        mtime = os.stat(self.path_template).st_mtime_ns
+        if self.template is not None and fileutils.is_unchanged(mtime, *self.template[:2]):
+            return False
+        logger.debug(f"Loading template {self.path_template}")
+        template = (mtime, time.time_ns(), fileutils.read(self.path_template))
+        changed = self.template is None or template[2] != self.template[2]
+        self.template = template
+        return changed
+
+    def walk(self, path_source, path_dest):
+        fileutils.ensure_directory_exists(path_dest)
+        self.visited.add((path_source, path_dest))
+        files, directories = self.list_directory(path_source)
+        for filename in files:
+            yield os.path.join(path_source, filename), os.path.join(path_dest, filename)
+        for dirname in directories:
+            yield from self.walk(os.path.join(path_source, dirname), os.path.join(path_dest, dirname))
+
+    def list_directory(self, path):
+        # The modification time of a directory changes whenever an entry is added, removed or renamed
+        mtime = os.stat(path).st_mtime_ns
+        cached = self.listings.get(path)
+        if cached and fileutils.is_unchanged(mtime, cached[0], cached[1]):
+            return cached[2], cached[3]
+        logger.debug(f"Scanning directory {path}")
+        time_read = time.time_ns()
+        files = []
+        directories = []
+        with os.scandir(path) as entries:
+            for entry in entries:
+                if entry.is_file():
+                    files.append(entry.name)
+                else:
+                    directories.append(entry.name)
+        self.listings[path] = (mtime, time_read, files, directories)
+        return files, directories
+
+    def copy_if_changed(self, path_source, path_dest):
+        stat = os.stat(path_source)
+        cached = self.copies.get(path_source)
+        if cached and stat.st_size == cached[2] and os.path.exists(path_dest):
+            if fileutils.is_unchanged(stat.st_mtime_ns, cached[0], cached[1]):
+                return False
+            # Recently modified files are compared by content instead
+            if filecmp.cmp(path_source, path_dest, shallow=False):
+                self.copies[path_source] = (stat.st_mtime_ns, time.time_ns(), stat.st_size)
+                return False
+        time_read = time.time_ns()
+        fileutils.copy(path_source, path_dest)
+        self.copies[path_source] = (stat.st_mtime_ns, time_read, stat.st_size)
+        return True
+
+    def render_if_changed(self, path_source, path_dest, template_changed, images_changed):
+        mtime = os.stat(path_source).st_mtime_ns
+        cached = self.pages.get(path_source)
+        source_unchanged = cached and fileutils.is_unchanged(mtime, cached[0], cached[1]) and not images_changed
+        if source_unchanged and not template_changed and os.path.exists(path_dest):
+            return False
+
+        if source_unchanged:
+            time_read, title, content = cached[1], cached[2], cached[3]
+        else:
+            logger.debug(f"Parsing file {path_source}")
+            time_read = time.time_ns()
+            transform = image_transform(self.images, self.path_public)
+            title, content = fileutils.parse_page(fileutils.read(path_source), lambda html_node: transform(html_node, path_dest))
+        content_file = fileutils.fill_template(self.template[2], title, content)
+        self.pages[path_source] = (mtime, time_read, title, content, content_file)
+
+        # Touched sources without any effective change do not count as changed
+        if cached and cached[4] == content_file and os.path.exists(path_dest):
+            return False
+        logger.debug(f"Writing file {path_dest}")
+        fileutils.write(path_dest, content_file)
+        return True
+
+class BuildHandler(socketserver.StreamRequestHandler):
+    def handle(self):
+        command = self.rfile.readline().decode().strip()
+        match command:
+            case "build":
+                try:
+                    response = {"changed": self.server.builder.build()}
+                except Exception as e:
+                    logger.exception("Build failed")
+                    response = {"error": str(e)}
+            case "stop":
+                self.server.stopped = True
+                response = {"stopped": True}
+            case _:
+                logger.warning(f"Unknown command {command}")
+                response = {"error": f"Unknown command {command}"}
+        self.wfile.write(json.dumps(response).encode())
+
+class BuildServer(socketserver.UnixStreamServer):
+    # Requests are handled one after another, so builds never overlap
+    def __init__(self, path_socket, builder):
+        super().__init__(path_socket, BuildHandler)
+        self.builder = builder
+        self.stopped = False
+
+def serve(path_socket, builder):
+    if os.path.exists(path_socket):
+        # Only a socket nobody listens on anymore is stale
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as connection:
+            try:
+                connection.connect(path_socket)
+            except ConnectionRefusedError:
+                logger.warning(f"Removing stale socket {path_socket}")
+                os.remove(path_socket)
+            else:
+                raise RuntimeError(f"Another daemon is already listening on {path_socket}")
+    with BuildServer(path_socket, builder) as server:
+        logger.info(f"Listening on {path_socket}")
+        try:
+            while not server.stopped:
+                server.handle_request()
+        finally:
+            os.remove(path_socket)
+    logger.info("Daemon stopped")
+
+def main():
+    logger_config.setup_logging(LOG_LEVEL)
+
+    builder = Builder(STATIC_FOLDER, CONTENT_FOLDER, PUBLIC_FOLDER, TEMPLATE_FILE, IMAGE_CACHE_FOLDER)
+    try:
+        serve(DAEMON_SOCKET, builder)
+    except RuntimeError as e:
+        logger.error(e)
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -1,12 +1,16 @@
 import logging
 import os
+import posixpath
 import shutil
 
-from blocknode import markdown_to_html, extract_title
+from blocknode import markdown_to_html_node, extract_title
 from constants import MARKDOWN_EXTENSION, HTML_EXTENSION
 
 logger = logging.getLogger(__name__)
 
+# Files modified shortly before they were read may change again within the same timestamp tick
+RACY_WINDOW_NS = 1_000_000_000
+
 def delete_directory_recursively(path):
     logger.info(f"Deleting directory {path}")
     shutil.rmtree(path, True)
@@ -34,11 +38,13 @@ def process_directory_recursively(path_source, path_dest, file_function, root=Tr
     for path_source_new, path_dest_new in directories:
         process_directory_recursively(path_source_new, path_dest_new, file_function, root=False, **kwargs)
 
-def copy(path_source, path_dest, **kwargs):
+def copy(path_source, path_dest, copied=None, **kwargs):
     logger.debug(f"Copying file {path_source} to {path_dest}")
     shutil.copy(path_source, path_dest)
+    if copied is not None:
+        copied.append((path_source, path_dest))
 
-def markdown_to_html_page(path_source, path_dest, path_template, **kwargs):
+def markdown_to_html_page(path_source, path_dest, path_template, transform=None, **kwargs):
     if not has_extension(path_source, MARKDOWN_EXTENSION):
         logger.warning(f"Found file {path_source} with unknown extension")
         return
@@ -49,11 +55,25 @@ def markdown_to_html_page(path_source, path_dest, path_template, **kwargs):
     content_origin = read(path_source)
     content_template = read(path_template)
     
-    title = extract_title(content_origin)
-    content = markdown_to_html(content_origin)
-    content_file = content_template.replace("{{ Title }}", title).replace("{{ Content }}", content)
-    
-    write(path_dest_html, content_file)
+    # The transform gets the html tree and the destination of the page
+    page_transform = None if transform is None else lambda html_node: transform(html_node, path_dest_html)
+    title, content = parse_page(content_origin, page_transform)
+    write(path_dest_html, fill_template(content_template, title, content))
+
+def public_url(path_dest, path_public):
+    return "/" + os.path.relpath(path_dest, path_public).replace(os.sep, "/")
+
+def page_url_directory(path_dest, path_public):
+    return posixpath.dirname(public_url(path_dest, path_public))
+
+def parse_page(content_origin, transform=None):
+    html_node = markdown_to_html_node(content_origin)
+    if transform:
+        transform(html_node)
+    return extract_title(content_origin), html_node.to_html()
+
+def fill_template(content_template, title, content):
+    return content_template.replace("{{ Title }}", title).replace("{{ Content }}", content)
     
 def has_extension(filename, extension):
     return filename.endswith(f".{extension}")
@@ -69,6 +89,9 @@ def write(filename, content):
     with open(filename, 'w') as file:
         file.write(content)
 
+def is_unchanged(mtime, mtime_cached, time_read):
+    return mtime == mtime_cached and mtime + RACY_WINDOW_NS < time_read
+
 def ensure_directory_exists(path):
     if not os.path.exists(path):
         logger.debug(f"Create directory {path}")
@@ -0,0 +1,178 @@
+import concurrent.futures
+import hashlib
+import logging
+import os
+import posixpath
+import shutil
+import tempfile
+import time
+
+from PIL import Image, ImageOps
+
+import fileutils
+from constants import IMAGE_EXTENSIONS, IMAGE_WIDTHS, IMAGE_SIZES
+
+logger = logging.getLogger(__name__)
+
+# EXIF orientations 5 to 8 rotate the image by 90 degrees, so width and height are swapped
+EXIF_ORIENTATION_TAG = 0x0112
+EXIF_ROTATED_ORIENTATIONS = {5, 6, 7, 8}
+
+def read_image_info(path):
+    # Opening is lazy, only the header is read and the image data is not decoded
+    try:
+        with Image.open(path) as image:
+            width, height = image.size
+            # Checking the info first keeps formats with trailing EXIF data (PNG) from loading the image
+            if "exif" in image.info and image.getexif().get(EXIF_ORIENTATION_TAG) in EXIF_ROTATED_ORIENTATIONS:
+                width, height = height, width
+            return width, height, getattr(image, "is_animated", False)
+    except Exception as e:
+        logger.warning(f"Cannot read image {path}: {e}")
+        return None
+
+def is_image(filename):
+    return filename.rsplit(".", 1)[-1].lower() in IMAGE_EXTENSIONS
+
+def hash_file(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as file:
+        while chunk := file.read(1 << 16):
+            digest.update(chunk)
+    return digest.hexdigest()[:16]
+
+def derivative_name(filename, digest, width):
+    stem, extension = os.path.splitext(os.path.basename(filename))
+    return f"{stem}-{digest}-{width}w{extension}"
+
+def resize_image(path_source, path_dest, width):
+    # Runs in a worker process and returns an error message instead of raising,
+    # the temporary file keeps half-written derivatives out of the cache
+    file_temporary, path_temporary = tempfile.mkstemp(dir=os.path.dirname(path_dest))
+    os.close(file_temporary)
+    try:
+        with Image.open(path_source) as image:
+            image_format = image.format
+            image = ImageOps.exif_transpose(image)
+            height = max(1, round(image.height * width / image.width))
+            resized = image.resize((width, height), Image.LANCZOS)
+        resized.save(path_temporary, format=image_format)
+        os.replace(path_temporary, path_dest)
+        return None
+    except Exception as e:
+        if os.path.exists(path_temporary):
+            os.remove(path_temporary)
+        return str(e)
+
+def image_url(src, url_directory="/"):
+    # Relative sources are resolved against the directory of the page like a browser does
+    if "://" in src or src.startswith(("//", "data:")):
+        return None
+    return posixpath.normpath(posixpath.join(url_directory, src))
+
+def add_image_attributes(html_node, images, url_directory="/"):
+    if html_node.children:
+        for child in html_node.children:
+            add_image_attributes(child, images, url_directory)
+        return
+    if html_node.tag != "img" or not html_node.props:
+        return
+    props = images.get(image_url(html_node.props["src"], url_directory))
+    if props:
+        html_node.props = html_node.props | props
+
+def image_transform(images, path_public):
+    # Page transform adding the attributes of the images found in the static folder
+    def transform(html_node, path_dest):
+        add_image_attributes(html_node, images, fileutils.page_url_directory(path_dest, path_public))
+    return transform
+
+class ImagePipeline:
+    # Derivatives are cached by source hash and width, so unchanged images are never processed again.
+    # Hashes, sizes and failed widths are remembered by modification time and size of the source.
+    def __init__(self, path_cache, widths=IMAGE_WIDTHS):
+        self.path_cache = path_cache
+        self.widths = sorted(widths)
+        self.sources = {}
+
+    def inspect(self, path):
+        stat = os.stat(path)
+        cached = self.sources.get(path)
+        if cached and fileutils.is_unchanged(stat.st_mtime_ns, cached[0], cached[1]) and stat.st_size == cached[2]:
+            return cached[3], cached[4]
+        time_read = time.time_ns()
+        image_info = read_image_info(path)
+        info = None if image_info is None else (hash_file(path), *image_info)
+        # Failures are only kept as long as the content is the same
+        failed = cached[4] if cached and info and cached[3] and cached[3][0] == info[0] else set()
+        self.sources[path] = (stat.st_mtime_ns, time_read, stat.st_size, info, failed)
+        return info, failed
+
+    def process(self, files, path_public):
+        # Returns the img attributes by url, all derivative paths and the derivatives copied in this call
+        candidates = []
+        jobs = {}
+        for path_source, path_dest in files:
+            if not is_image(path_source):
+                continue
+            info, failed = self.inspect(path_source)
+            if info is None:
+                continue
+            digest, width, _, animated = info
+            # Animated images would be reduced to their first frame
+            targets = [] if animated else [target for target in self.widths if target < width and target not in failed]
+            derivatives = []
+            for target in targets:
+                name = derivative_name(path_source, digest, target)
+                path_cached = os.path.join(self.path_cache, name)
+                # Identical images with the same name share their derivatives
+                if not os.path.exists(path_cached):
+                    jobs[path_cached] = (path_source, path_cached, target)
+                derivatives.append((target, path_cached, os.path.join(os.path.dirname(path_dest), name)))
+            candidates.append((path_dest, info, failed, derivatives))
+
+        failed_jobs = self.resize_all(list(jobs.values()))
+
+        images = {}
+        all_derivatives = []
+        copied = []
+        for path_dest, (_, width, height, _), failed, derivatives in candidates:
+            url = fileutils.public_url(path_dest, path_public)
+            srcset = []
+            for target, path_cached, path_derivative in derivatives:
+                # Failed derivatives are left out of the srcset and not retried
+                if path_cached in failed_jobs:
+                    failed.add(target)
+                    continue
+                if not os.path.exists(path_derivative):
+                    logger.debug(f"Copying derivative {path_cached} to {path_derivative}")
+                    shutil.copy(path_cached, path_derivative)
+                    copied.append(path_derivative)
+                all_derivatives.append(path_derivative)
+                srcset.append(f"{fileutils.public_url(path_derivative, path_public)} {target}w")
+
+            props = {"width": str(width), "height": str(height)}
+            if srcset:
+                props["srcset"] = ", ".join(srcset + [f"{url} {width}w"])
+                props["sizes"] = IMAGE_SIZES
+            images[url] = props
+        return images, all_derivatives, copied
+
+    def resize_all(self, jobs):
+        # Returns the cache paths of all failed jobs
+        failed_jobs = set()
+        if not jobs:
+            return failed_jobs
+        logger.info(f"Generating {len(jobs)} image derivatives")
+        os.makedirs(self.path_cache, exist_ok=True)
+        with concurrent.futures.ProcessPoolExecutor() as executor:
+            futures = {executor.submit(resize_image, *job): job for job in jobs}
+            for future, (path_source, path_cached, width) in futures.items():
+                try:
+                    error = future.result()
+                except Exception as e:
+                    error = str(e)
+                if error:
+                    logger.error(f"Resizing {path_source} to width {width} failed: {error}")
+                    failed_jobs.add(path_cached)
+        return failed_jobs
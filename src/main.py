@@ -3,7 +3,8 @@ import logging
 import logger_config
 import fileutils
 
-from constants import LOG_LEVEL, STATIC_FOLDER, CONTENT_FOLDER, PUBLIC_FOLDER, TEMPLATE_FILE
+from constants import LOG_LEVEL, STATIC_FOLDER, CONTENT_FOLDER, PUBLIC_FOLDER, TEMPLATE_FILE, IMAGE_CACHE_FOLDER
+from imageutils import ImagePipeline, image_transform
 
 logger = logging.getLogger(__name__)
 
@@ -11,8 +12,10 @@ def main():
     logger_config.setup_logging(LOG_LEVEL)
     
     fileutils.delete_directory_recursively(PUBLIC_FOLDER)
-    fileutils.process_directory_recursively(STATIC_FOLDER, PUBLIC_FOLDER, fileutils.copy)
-    fileutils.process_directory_recursively(CONTENT_FOLDER, PUBLIC_FOLDER, fileutils.markdown_to_html_page, path_template=TEMPLATE_FILE)
+    static_files = []
+    fileutils.process_directory_recursively(STATIC_FOLDER, PUBLIC_FOLDER, fileutils.copy, copied=static_files)
+    images, _, _ = ImagePipeline(IMAGE_CACHE_FOLDER).process(static_files, PUBLIC_FOLDER)
+    fileutils.process_directory_recursively(CONTENT_FOLDER, PUBLIC_FOLDER, fileutils.markdown_to_html_page, path_template=TEMPLATE_FILE, transform=image_transform(images, PUBLIC_FOLDER))
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,132 @@
+import os
+import socket
+import tempfile
+import threading
+import time
+import unittest
+
+import fileutils
+from client import request
+from daemon import Builder, serve
+
+class TestBuilder(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        root = self.directory.name
+        self.path_static = os.path.join(root, "static")
+        self.path_content = os.path.join(root, "content")
+        self.path_public = os.path.join(root, "public")
+        self.path_template = os.path.join(root, "template.html")
+        self.path_image_cache = os.path.join(root, "cache")
+        os.mkdir(self.path_static)
+        os.makedirs(os.path.join(self.path_content, "blog"))
+        fileutils.write(self.path_template, "<title>{{ Title }}</title>{{ Content }}")
+        fileutils.write(os.path.join(self.path_static, "index.css"), "body {}")
+        fileutils.write(os.path.join(self.path_content, "index.md"), "# Home")
+        fileutils.write(os.path.join(self.path_content, "blog", "post.md"), "# Post\n\nText")
+        self.builder = Builder(self.path_static, self.path_content, self.path_public, self.path_template, self.path_image_cache)
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def public(self, *path):
+        return os.path.join(self.path_public, *path)
+
+    def touch(self, path, content):
+        # Bump the modification time explicitly as file systems may have a coarse resolution
+        fileutils.write(path, content)
+        stat = os.stat(path)
+        os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000_000))
+
+    def test_first_build(self):
+        changed = self.builder.build()
+        expected = sorted([self.public("index.css"), self.public("index.html"), self.public("blog", "post.html")])
+        self.assertEqual(changed, expected)
+        self.assertEqual(fileutils.read(self.public("blog", "post.html")), "<title>Post</title><div><h1>Post</h1><p>Text</p></div>")
+
+    def test_unchanged_build(self):
+        self.builder.build()
+        self.assertEqual(self.builder.build(), [])
+
+    def test_changed_page(self):
+        self.builder.build()
+        self.touch(os.path.join(self.path_content, "index.md"), "# Start")
+        self.assertEqual(self.builder.build(), [self.public("index.html")])
+        self.assertEqual(fileutils.read(self.public("index.html")), "<title>Start</title><div><h1>Start</h1></div>")
+        self.touch(os.path.join(self.path_content, "index.md"), "# Start")
+        self.assertEqual(self.builder.build(), [])
+
+    def test_changed_template(self):
+        self.builder.build()
+        self.touch(self.path_template, "{{ Title }}")
+        self.assertEqual(self.builder.build(), [self.public("blog", "post.html"), self.public("index.html")])
+        self.assertEqual(fileutils.read(self.public("index.html")), "Home")
+
+    def test_added_and_removed_files(self):
+        self.builder.build()
+        fileutils.write(os.path.join(self.path_content, "about.md"), "# About")
+        os.remove(os.path.join(self.path_content, "blog", "post.md"))
+        self.assertEqual(self.builder.build(), [self.public("about.html"), self.public("blog", "post.html")])
+        self.assertFalse(os.path.exists(self.public("blog", "post.html")))
+
+    def test_removed_directory(self):
+        self.builder.build()
+        os.remove(os.path.join(self.path_content, "blog", "post.md"))
+        os.rmdir(os.path.join(self.path_content, "blog"))
+        self.assertEqual(self.builder.build(), [self.public("blog", "post.html")])
+        self.assertFalse(os.path.exists(self.public("blog")))
+        self.assertNotIn(os.path.join(self.path_content, "blog"), self.builder.listings)
+        self.assertNotIn(os.path.join(self.path_content, "blog", "post.md"), self.builder.pages)
+
+class TestServer(unittest.TestCase):
+    def test_build_and_stop(self):
+        with tempfile.TemporaryDirectory() as root:
+            path_socket = os.path.join(root, "build.sock")
+            path_content = os.path.join(root, "content")
+            path_template = os.path.join(root, "template.html")
+            os.mkdir(path_content)
+            fileutils.write(path_template, "{{ Content }}")
+            fileutils.write(os.path.join(path_content, "index.md"), "# Home")
+            builder = Builder(path_content, path_content, os.path.join(root, "public"), path_template, os.path.join(root, "cache"))
+            thread = threading.Thread(target=serve, args=(path_socket, builder), daemon=True)
+            thread.start()
+            # Wait until the daemon accepts connections
+            deadline = time.monotonic() + 5
+            while True:
+                try:
+                    response = request(path_socket, "build")
+                    break
+                except (FileNotFoundError, ConnectionRefusedError):
+                    if time.monotonic() > deadline:
+                        self.fail("Daemon did not start listening")
+                    time.sleep(0.01)
+            self.assertEqual(len(response["changed"]), 2)
+            self.assertEqual(request(path_socket, "build"), {"changed": []})
+            self.assertIn("error", request(path_socket, "unknown"))
+            # A second daemon must not take over the socket
+            with self.assertRaises(RuntimeError):
+                serve(path_socket, builder)
+            self.assertEqual(request(path_socket, "stop"), {"stopped": True})
+            thread.join()
+            self.assertFalse(os.path.exists(path_socket))
+
+    def test_stale_socket(self):
+        with tempfile.TemporaryDirectory() as root:
+            path_socket = os.path.join(root, "build.sock")
+            with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as listener:
+                listener.bind(path_socket)
+            path_template = os.path.join(root, "template.html")
+            fileutils.write(path_template, "{{ Content }}")
+            builder = Builder(root, root, os.path.join(root, "public"), path_template, os.path.join(root, "cache"))
+            thread = threading.Thread(target=serve, args=(path_socket, builder), daemon=True)
+            thread.start()
+            deadline = time.monotonic() + 5
+            while True:
+                try:
+                    self.assertEqual(request(path_socket, "stop"), {"stopped": True})
+                    break
+                except (FileNotFoundError, ConnectionRefusedError):
+                    if time.monotonic() > deadline:
+                        self.fail("Daemon did not replace the stale socket")
+                    time.sleep(0.01)
+            thread.join()
@@ -0,0 +1,166 @@
+import os
+import tempfile
+import unittest
+
+from PIL import Image
+
+import imageutils
+from constants import IMAGE_SIZES
+from fileutils import parse_page, page_url_directory
+from imageutils import ImagePipeline, read_image_info, image_url, derivative_name, add_image_attributes
+
+class TestReadImageInfo(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, "image")
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_formats(self):
+        for image_format in ("PNG", "GIF", "JPEG", "WEBP"):
+            Image.new("RGB", (640, 480)).save(self.path, format=image_format)
+            self.assertEqual(read_image_info(self.path), (640, 480, False))
+
+    def test_exif_orientation(self):
+        for orientation, expected in ((1, (1024, 768, False)), (6, (768, 1024, False))):
+            image = Image.new("RGB", (1024, 768))
+            exif = image.getexif()
+            exif[0x0112] = orientation
+            image.save(self.path, format="JPEG", exif=exif)
+            self.assertEqual(read_image_info(self.path), expected)
+
+    def test_unknown_and_truncated(self):
+        with open(self.path, 'wb') as file:
+            file.write(b"no image at all")
+        self.assertIsNone(read_image_info(self.path))
+        with open(self.path, 'wb') as file:
+            file.write(b"\xff\xd8\xff\xe0\x00\x10JFIF\x00" + bytes(9) + b"\xff\xff")
+        self.assertIsNone(read_image_info(self.path))
+
+class TestImageAttributes(unittest.TestCase):
+    def test_image_url(self):
+        self.assertEqual(image_url("images/a.png"), "/images/a.png")
+        self.assertEqual(image_url("./images/a.png"), "/images/a.png")
+        self.assertEqual(image_url("/images/a.png"), "/images/a.png")
+        self.assertEqual(image_url("a.png", "/blog"), "/blog/a.png")
+        self.assertEqual(image_url("../images/a.png", "/blog/2024"), "/blog/images/a.png")
+        self.assertEqual(image_url("/images/a.png", "/blog"), "/images/a.png")
+        self.assertIsNone(image_url("https://www.libellen.tv/images/viele-libellen.webp", "/blog"))
+
+    def test_page_url_directory(self):
+        self.assertEqual(page_url_directory(os.path.join("public", "index.html"), "public"), "/")
+        self.assertEqual(page_url_directory(os.path.join("public", "blog", "post.html"), "public"), "/blog")
+
+    def test_derivative_name(self):
+        self.assertEqual(derivative_name("./static/images/a.png", "0123abcd", 480), "a-0123abcd-480w.png")
+
+    def test_parse_page(self):
+        images = {"/a.png": {"width": "640", "height": "480"}}
+        _, content = parse_page("# Title\n\n![alt](a.png) and ![other](b.png)", lambda html_node: add_image_attributes(html_node, images))
+        expected = '<div><h1>Title</h1><p><img src="a.png" alt="alt" width="640" height="480"></img> and <img src="b.png" alt="other"></img></p></div>'
+        self.assertEqual(content, expected)
+
+    def test_parse_nested_page(self):
+        images = {"/a.png": {"width": "640", "height": "480"}, "/blog/a.png": {"width": "32", "height": "16"}}
+        _, content = parse_page("![x](a.png) ![y](../a.png)", lambda html_node: add_image_attributes(html_node, images, "/blog"))
+        expected = '<div><p><img src="a.png" alt="x" width="32" height="16"></img> <img src="../a.png" alt="y" width="640" height="480"></img></p></div>'
+        self.assertEqual(content, expected)
+
+class TestImagePipeline(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        root = self.directory.name
+        self.path_static = os.path.join(root, "static")
+        self.path_public = os.path.join(root, "public")
+        self.path_cache = os.path.join(root, "cache")
+        os.makedirs(os.path.join(self.path_static, "images"))
+        os.makedirs(os.path.join(self.path_public, "images"))
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def files(self):
+        return [(os.path.join(self.path_static, "images", filename), os.path.join(self.path_public, "images", filename))
+                for filename in os.listdir(os.path.join(self.path_static, "images"))]
+
+    def path(self, filename):
+        return os.path.join(self.path_static, "images", filename)
+
+    def test_derivatives(self):
+        Image.new("RGB", (1000, 500)).save(self.path("a.png"))
+        Image.new("RGB", (100, 50)).save(self.path("small.png"))
+        pipeline = ImagePipeline(self.path_cache)
+        images, derivatives, copied = pipeline.process(self.files(), self.path_public)
+        digest = imageutils.hash_file(self.path("a.png"))
+        name = f"a-{digest}-480w.png"
+        expected = {"/images/a.png": {"width": "1000", "height": "500", "srcset": f"/images/{name} 480w, /images/{name.replace('480w', '960w')} 960w, /images/a.png 1000w", "sizes": IMAGE_SIZES},
+                    "/images/small.png": {"width": "100", "height": "50"}}
+        self.assertEqual(images, expected)
+        self.assertEqual(len(copied), 2)
+        self.assertEqual(read_image_info(os.path.join(self.path_public, "images", name)), (480, 240, False))
+
+        # Cached derivatives are not generated again, only missing copies are restored
+        os.remove(os.path.join(self.path_public, "images", name))
+        pipeline = ImagePipeline(self.path_cache)
+        pipeline.resize_all = lambda jobs: self.assertEqual(jobs, []) or set()
+        _, _, copied = pipeline.process(self.files(), self.path_public)
+        self.assertEqual(copied, [os.path.join(self.path_public, "images", name)])
+
+    def test_rotated_derivatives(self):
+        image = Image.new("RGB", (1000, 500))
+        exif = image.getexif()
+        exif[0x0112] = 6
+        image.save(self.path("a.jpg"), exif=exif)
+        images, derivatives, _ = ImagePipeline(self.path_cache).process(self.files(), self.path_public)
+        self.assertEqual((images["/images/a.jpg"]["width"], images["/images/a.jpg"]["height"]), ("500", "1000"))
+        self.assertEqual(len(derivatives), 1)
+        self.assertEqual(read_image_info(derivatives[0]), (480, 960, False))
+
+    def test_animated_images(self):
+        frames = [Image.new("RGB", (1000, 500), color) for color in ("red", "blue")]
+        frames[0].save(self.path("a.gif"), save_all=True, append_images=frames[1:])
+        images, derivatives, _ = ImagePipeline(self.path_cache).process(self.files(), self.path_public)
+        self.assertEqual(images, {"/images/a.gif": {"width": "1000", "height": "500"}})
+        self.assertEqual(derivatives, [])
+
+    def test_failed_derivatives(self):
+        # The header is valid, but the image data is truncated
+        Image.effect_noise((2000, 1000), 64).save(self.path("a.png"))
+        with open(self.path("a.png"), 'r+b') as file:
+            file.truncate(os.path.getsize(self.path("a.png")) // 2)
+        pipeline = ImagePipeline(self.path_cache)
+        images, derivatives, copied = pipeline.process(self.files(), self.path_public)
+        self.assertEqual(images, {"/images/a.png": {"width": "2000", "height": "1000"}})
+        self.assertEqual(derivatives, [])
+        self.assertEqual(copied, [])
+        self.assertEqual(os.listdir(self.path_cache), [])
+
+        # Failed derivatives are not retried as long as the image is unchanged
+        pipeline.resize_all = lambda jobs: self.assertEqual(jobs, []) or set()
+        images, _, _ = pipeline.process(self.files(), self.path_public)
+        self.assertEqual(images, {"/images/a.png": {"width": "2000", "height": "1000"}})
+
+    def test_shared_derivatives(self):
+        os.makedirs(os.path.join(self.path_static, "other"))
+        os.makedirs(os.path.join(self.path_public, "other"))
+        Image.new("RGB", (1000, 500)).save(self.path("a.png"))
+        Image.new("RGB", (1000, 500)).save(os.path.join(self.path_static, "other", "a.png"))
+        files = self.files() + [(os.path.join(self.path_static, "other", "a.png"), os.path.join(self.path_public, "other", "a.png"))]
+        pipeline = ImagePipeline(self.path_cache)
+        resize_all = pipeline.resize_all
+        pipeline.resize_all = lambda jobs: self.assertEqual(len(jobs), 2) or resize_all(jobs)
+        images, derivatives, _ = pipeline.process(files, self.path_public)
+        self.assertEqual(len(derivatives), 4)
+        self.assertEqual(len(os.listdir(self.path_cache)), 2)
+        self.assertIn("srcset", images["/other/a.png"])
+
+    def test_rewritten_image(self):
+        pipeline = ImagePipeline(self.path_cache, widths=[])
+        Image.new("RGB", (1000, 500), "red").save(self.path("a.png"))
+        stat = os.stat(self.path("a.png"))
+        digest = pipeline.inspect(self.path("a.png"))[0][0]
+        # Same size and modification time, but rewritten right after being read
+        Image.new("RGB", (1000, 500), "blue").save(self.path("a.png"))
+        os.utime(self.path("a.png"), ns=(stat.st_atime_ns, stat.st_mtime_ns))
+        self.assertNotEqual(pipeline.inspect(self.path("a.png"))[0][0], digest)